@@ -0,0 +1,204 @@
+import csv
+import sys
+import logging
+import argparse
+from dataclasses import dataclass
+from typing import Dict, List
+import numpy as np
+from data_extractor import ExtractedData
+
+# Validation flags (bit mask per record)
+ZERO_ESTIMATE = 1        # RealAVM value missing or $0 (failed regex)
+ZERO_LIST_PRICE = 2      # High bound missing or $0; this is the price printed on the page
+INVERTED_RANGE = 4       # High bound below the low bound
+OUTSIDE_RANGE = 8        # Estimate not between the low and high bounds
+MISSING_ZIP = 16
+ZIP_OUTLIER = 32         # Estimate far from the other estimates in the same zip
+
+FLAG_NAMES = {
+    ZERO_ESTIMATE: "zero_estimate",
+    ZERO_LIST_PRICE: "zero_list_price",
+    INVERTED_RANGE: "inverted_range",
+    OUTSIDE_RANGE: "outside_range",
+    MISSING_ZIP: "missing_zip",
+    ZIP_OUTLIER: "zip_outlier",
+}
+
+# Flags that make a record unusable for printing. OUTSIDE_RANGE and ZIP_OUTLIER
+# can be legitimate (e.g. an expensive home) and are only reported.
+INVALID_FLAGS = ZERO_ESTIMATE | ZERO_LIST_PRICE | INVERTED_RANGE | MISSING_ZIP
+
+# Robust z-score (median/MAD on log values) above which an estimate is a zip outlier
+OUTLIER_THRESHOLD = 3.5
+# Zips with fewer valid estimates than this are not checked for outliers
+OUTLIER_MIN_GROUP = 5
+
+
+@dataclass
+class AVMArrays:
+    estimated_value: np.ndarray
+    value_range_low: np.ndarray
+    value_range_high: np.ndarray
+    zip_code: np.ndarray
+    city: np.ndarray
+
+    @classmethod
+    def from_records(cls, data_list: List[ExtractedData]) -> "AVMArrays":
+        count = len(data_list)
+        return cls(
+            estimated_value=np.fromiter((d.estimated_value for d in data_list), dtype=np.float64, count=count),
+            value_range_low=np.fromiter((d.value_range_low for d in data_list), dtype=np.float64, count=count),
+            value_range_high=np.fromiter((d.value_range_high for d in data_list), dtype=np.float64, count=count),
+            zip_code=np.array([d.zip_code.strip() for d in data_list], dtype=str),
+            city=np.array([" ".join(d.city_and_state.split()).upper() for d in data_list], dtype=str),
+        )
+
+    def __len__(self):
+        return len(self.estimated_value)
+
+
+def _grouped_median(values: np.ndarray, groups: np.ndarray, group_count: int):
+    """Median of values per group id; groups without values get NaN."""
+    counts = np.bincount(groups, minlength=group_count)
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(group_count, np.nan)
+    present = counts > 0
+    lower = starts[present] + (counts[present] - 1) // 2
+    upper = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[lower] + sorted_values[upper]) / 2
+    return medians
+
+
+def validate(arrays: AVMArrays) -> np.ndarray:
+    """Return the validation flag mask for every record."""
+    est, low, high = arrays.estimated_value, arrays.value_range_low, arrays.value_range_high
+    flags = np.zeros(len(arrays), dtype=np.uint8)
+    flags[est <= 0] |= ZERO_ESTIMATE
+    flags[high <= 0] |= ZERO_LIST_PRICE
+    has_range = (low > 0) & (high > 0)
+    flags[has_range & (high < low)] |= INVERTED_RANGE
+    flags[has_range & (est > 0) & ((est < low) | (est > high))] |= OUTSIDE_RANGE
+    flags[arrays.zip_code == ""] |= MISSING_ZIP
+
+    # Zip outliers: robust z-score of log estimates against the zip's median
+    checked = (est > 0) & (arrays.zip_code != "")
+    if checked.any():
+        zips, groups = np.unique(arrays.zip_code[checked], return_inverse=True)
+        log_values = np.log(est[checked])
+        medians = _grouped_median(log_values, groups, len(zips))
+        deviations = np.abs(log_values - medians[groups])
+        mads = _grouped_median(deviations, groups, len(zips)) * 1.4826
+        counts = np.bincount(groups, minlength=len(zips))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = deviations / mads[groups]
+        outliers = (counts[groups] >= OUTLIER_MIN_GROUP) & (mads[groups] > 0) & (scores > OUTLIER_THRESHOLD)
+        checked_idx = np.flatnonzero(checked)
+        flags[checked_idx[outliers]] |= ZIP_OUTLIER
+    return flags
+
+
+def grouped_summary(keys: np.ndarray, values: np.ndarray, valid: np.ndarray) -> List[Dict]:
+    """Count, mean, median, min and max of the valid values per key."""
+    names, groups, total = np.unique(keys, return_inverse=True, return_counts=True)
+    groups = groups.ravel()
+    group_count = len(names)
+    valid_groups = groups[valid]
+    valid_values = values[valid]
+    counts = np.bincount(valid_groups, minlength=group_count)
+    sums = np.bincount(valid_groups, weights=valid_values, minlength=group_count)
+    minimums = np.full(group_count, np.inf)
+    maximums = np.full(group_count, -np.inf)
+    np.minimum.at(minimums, valid_groups, valid_values)
+    np.maximum.at(maximums, valid_groups, valid_values)
+    medians = _grouped_median(valid_values, valid_groups, group_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / counts
+
+    summary = []
+    for i, name in enumerate(names):
+        has_values = counts[i] > 0
+        summary.append({
+            "group": str(name) or "(blank)",
+            "records": int(total[i]),
+            "valid": int(counts[i]),
+            "flagged": int(total[i] - counts[i]),
+            "mean": float(means[i]) if has_values else None,
+            "median": float(medians[i]) if has_values else None,
+            "min": float(minimums[i]) if has_values else None,
+            "max": float(maximums[i]) if has_values else None,
+        })
+    return summary
+
+
+def analyze(data_list: List[ExtractedData]) -> Dict:
+    """Validate the records and summarize the valid estimates per zip and per city."""
+    arrays = AVMArrays.from_records(data_list)
+    flags = validate(arrays)
+    valid = flags == 0
+    flag_counts = {name: int(np.count_nonzero(flags & bit)) for bit, name in FLAG_NAMES.items()}
+    return {
+        "records": len(arrays),
+        "flagged": int(np.count_nonzero(~valid)),
+        "flag_counts": flag_counts,
+        "flags": flags,
+        "by_zip": grouped_summary(arrays.zip_code, arrays.estimated_value, valid),
+        "by_city": grouped_summary(arrays.city, arrays.estimated_value, valid),
+    }
+
+
+def drop_flagged_records(data_list: List[ExtractedData], flags: np.ndarray = None) -> List[ExtractedData]:
+    """Keep only the records without INVALID_FLAGS.
+
+    These checks look at each record on its own, so the result does not depend
+    on which other records (e.g. other files of the campaign) are passed in.
+    """
+    if not data_list:
+        return data_list
+    if flags is None:
+        flags = validate(AVMArrays.from_records(data_list))
+    keep = np.flatnonzero((flags & INVALID_FLAGS) == 0)
+    if len(keep) < len(data_list):
+        logging.info("Dropping %d of %d record(s) with invalid AVM values", len(data_list) - len(keep), len(data_list))
+    return [data_list[i] for i in keep]
+
+
+def describe_flags(flag: int) -> str:
+    return ", ".join(name for bit, name in FLAG_NAMES.items() if flag & bit)
+
+
+def write_report(report: Dict, report_path: str):
+    """Write the per-zip and per-city summaries to a CSV file."""
+    fields = ["level", "group", "records", "valid", "flagged", "mean", "median", "min", "max"]
+    with open(report_path, "w", newline="", encoding="utf-8") as report_file:
+        writer = csv.DictWriter(report_file, fieldnames=fields)
+        writer.writeheader()
+        for level in ("zip", "city"):
+            for row in report[f"by_{level}"]:
+                writer.writerow({"level": level, **row})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize and validate extracted AVM values")
+    parser.add_argument("report", help="CSV file to write the per-zip/per-city summary to")
+    parser.add_argument("input_files", nargs="+")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from data_extractor import PDFExtractor
+    data_list = []
+    for input_file in args.input_files:
+        data_list.extend(PDFExtractor(input_file).extract_data())
+
+    report = analyze(data_list)
+    write_report(report, args.report)
+    print(f"{report['records']} record(s), {report['flagged']} flagged")
+    for name, count in report["flag_counts"].items():
+        if count:
+            print(f"  {name}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Work Queue Check
+Runs several workers against one temporary queue to check throughput
+scaling and crash recovery before pointing real machines at a share.
+"""
+
+import os
+import sys
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import multiprocessing
+import fitz  # PyMuPDF
+from work_queue import WorkQueue, DONE, _run_worker
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "4_ Large Batch of PDF Files For Testing.pdf")
+
+
+def prepare_queue(work_dir, name, input_file, copies, pages_per_job, lease_seconds):
+    """Create a fresh queue with `copies` copies of the input split into page-range jobs"""
+    queue_dir = os.path.join(work_dir, name)
+    input_dir = os.path.join(queue_dir, "input")
+    output_dir = os.path.join(queue_dir, "output")
+    os.makedirs(input_dir)
+    os.makedirs(output_dir)
+    queue = WorkQueue(os.path.join(queue_dir, "queue.db"), lease_seconds=lease_seconds)
+    for i in range(copies):
+        copy_path = os.path.join(input_dir, f"batch_{i + 1}.pdf")
+        shutil.copy(input_file, copy_path)
+        queue.enqueue_file(copy_path, output_dir, pages_per_job)
+    return queue
+
+
+def start_workers(queue, count, idle_timeout):
+    workers = [multiprocessing.Process(target=_run_worker,
+                                       args=(queue.db_path, queue.lease_seconds, queue.max_attempts, idle_timeout))
+               for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def worker_id_of(process):
+    # Matches the default QueueWorker id
+    return f"{socket.gethostname()}-{process.pid}"
+
+
+def check_outputs(queue):
+    """Every job is done, registered exactly once, and its output has two pages per input page"""
+    jobs = queue.jobs()
+    results = {row["job_key"]: row for row in queue.results()}
+    assert all(job["status"] == DONE for job in jobs), queue.stats()
+    assert len(results) == len(jobs), f"{len(results)} result(s) for {len(jobs)} job(s)"
+    for job in jobs:
+        result = results[job["job_key"]]
+        with fitz.open(result["output_path"]) as output:
+            expected = 2 * (job["page_end"] - job["page_start"])
+            assert output.page_count == expected, f"{result['output_path']}: {output.page_count} != {expected}"
+    return jobs, results
+
+
+def run_throughput(work_dir, args):
+    timings = {}
+    for count in sorted({1, args.workers}):
+        queue = prepare_queue(work_dir, f"throughput_{count}", args.input, args.copies,
+                              args.pages_per_job, args.lease_seconds)
+        started = time.time()
+        workers = start_workers(queue, count, idle_timeout=1)
+        # Time until the queue drains, not until the idle workers give up polling
+        while any(job["status"] != DONE for job in queue.jobs()):
+            time.sleep(0.05)
+        timings[count] = time.time() - started
+        for worker in workers:
+            worker.join()
+        jobs, _ = check_outputs(queue)
+        print(f"  {count} worker(s): {len(jobs)} job(s) in {timings[count]:.1f}s")
+    if args.workers > 1:
+        print(f"  Speed-up with {args.workers} workers: {timings[1] / timings[args.workers]:.1f}x "
+              f"({os.cpu_count()} CPU(s) on this host)")
+
+
+def run_crash_recovery(work_dir, args):
+    queue = prepare_queue(work_dir, "crash", args.input, args.copies, args.pages_per_job, args.lease_seconds)
+    workers = start_workers(queue, args.workers, idle_timeout=args.lease_seconds * 3)
+    victim = workers[0]
+    victim_id = worker_id_of(victim)
+
+    # Kill the first worker as soon as it is in the middle of a job
+    deadline = time.time() + 60
+    killed_job = None
+    while killed_job is None:
+        assert time.time() < deadline, "first worker never leased a job"
+        leased = [job for job in queue.jobs() if job["status"] == "leased" and job["worker_id"] == victim_id]
+        if leased:
+            victim.kill()
+            victim.join()
+            killed_job = leased[0]
+        else:
+            time.sleep(0.02)
+    print(f"  Killed {victim_id} during job {killed_job['id']}")
+
+    for worker in workers[1:]:
+        worker.join()
+
+    jobs, results = check_outputs(queue)
+    recovered = next(job for job in jobs if job["id"] == killed_job["id"])
+    result = results[recovered["job_key"]]
+    assert recovered["attempts"] >= 2, "killed job was not leased again"
+    assert result["worker_id"] != victim_id, "killed worker registered a result"
+    staging_root = os.path.join(os.path.dirname(result["output_path"]), ".staging")
+    assert not os.path.exists(staging_root), f"staging left behind: {os.listdir(staging_root)}"
+    print(f"  Job {recovered['id']} re-leased (attempt {recovered['attempts']}) and finished once "
+          f"by {result['worker_id']}; {len(jobs)} job(s) done, {len(results)} result(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the work queue with several local workers")
+    parser.add_argument("--input", default=SAMPLE_PDF, help="Input PDF to queue")
+    parser.add_argument("--copies", type=int, default=4, help="Copies of the input to queue")
+    parser.add_argument("--pages-per-job", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lease-seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="work_queue_check_")
+    try:
+        print("🔧 Throughput")
+        run_throughput(work_dir, args)
+        print("🔧 Crash recovery")
+        run_crash_recovery(work_dir, args)
+    except AssertionError as e:
+        print(f"❌ Work queue check failed: {e}")
+        return 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("✅ Work queue check passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
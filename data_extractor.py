@@ -1,6 +1,6 @@
 import fitz  # PyMuPDF
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional
 import re
 
 @dataclass
@@ -14,14 +14,27 @@ class ExtractedData:
     value_range_low: float
     value_range_high: float
 
+    @property
+    def record_key(self) -> str:
+        """Identifies the property/recipient a page was generated for.
+
+        Built from every text field printed on the page, so it can also be read
+        back from a generated output. Empty when all of them are blank.
+        """
+        parts = (self.recipient_name, self.street_address, self.city_and_state,
+                 self.zip_code, self.full_address)
+        if not any(part.strip() for part in parts):
+            return ""
+        return "|".join(" ".join(part.split()).casefold() for part in parts)
+
 class PDFExtractor:
     def __init__(self, pdf_path: str):
         self.pdf_path = pdf_path
         self.doc = fitz.open(pdf_path)
     
-    def extract_data(self) -> List[ExtractedData]:
+    def extract_data(self, page_start: int = 0, page_end: Optional[int] = None) -> List[ExtractedData]:
         extracted_data_list = []
-        for page in self.doc: 
+        for page in self.doc.pages(page_start, page_end): 
             text = page.get_text()
             if not text.strip():
                 print("No text extracted from page in file: %s", self.pdf_path)
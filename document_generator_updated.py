@@ -1,4 +1,5 @@
 import os
+import logging
 import fitz  # PyMuPDF
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
@@ -17,14 +18,17 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from PyPDF2 import PdfReader, PdfWriter
 import io
+import re
 
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
 class DocumentGenerator:
-    def __init__(self, output_dir: str, input_file: str):
+    def __init__(self, output_dir: str, input_file: str, output_name: str = None):
         self.output_dir = output_dir 
         self.input_file = input_file
+        # Base name used for the fmtd_/pg_ files; defaults to the input file name
+        self.output_name = output_name or os.path.basename(input_file)
         self._setup_fonts()
 
     def _setup_fonts(self):
@@ -43,12 +47,12 @@ class DocumentGenerator:
                 os.remove(pdf_path)
 
 
-    def generate_pdf(self, data_list: list[ExtractedData]):
+    def generate_pdf(self, data_list: list[ExtractedData], page_callback=None):
         merger = PdfMerger()  # Initialize PDF merger
         generated_pdfs = []  # Store paths of generated PDFs
 
         existing_pdf_path = os.path.join(current_dir, "docs", 'Page 2 REVISED NEW.pdf')  # Existing PDF for alternate pages
-        file_base_name = os.path.basename(self.input_file)
+        file_base_name = self.output_name
         final_pdf_path = os.path.join(self.output_dir, f"fmtd_{file_base_name}")
         for index, data in enumerate(data_list):
             generated_pdf_path = os.path.join(self.output_dir, f"pg_{index + 1}_{file_base_name}")
@@ -56,6 +60,9 @@ class DocumentGenerator:
 
             # Create a new PDF page
             self.create_pdf_page(generated_pdf_path, data)
+            if page_callback:
+                # Called while the single-page PDF still exists, before it is merged
+                page_callback(index, generated_pdf_path)
 
             # Append generated PDF page and existing PDF as alternating pages
             merger.append(generated_pdf_path)
@@ -65,8 +72,144 @@ class DocumentGenerator:
         merger.write(final_pdf_path)
         merger.close()
 
+        # Record which records the output contains so later runs can append to it
+        with open(self.record_index_path(final_pdf_path), "w", encoding="utf-8") as index_file:
+            index_file.writelines(data.record_key + "\n" for data in data_list)
+
         # Cleanup generated PDFs
         self.delete_generated_pdfs(generated_pdfs)
+        return final_pdf_path
+
+    # Baselines (points from the top of the page) where create_pdf_page draws the
+    # record's fields; keep in sync with its layout
+    RECIPIENT_BASELINE = 153
+    STREET_BASELINE = 166
+    CITY_ZIP_BASELINE = 179
+    FULL_ADDRESS_BASELINE = 432.5
+
+    @staticmethod
+    def record_index_path(final_pdf_path: str) -> str:
+        """Path of the record-key index kept next to a formatted output.
+
+        The index has one line per record in output order, empty for records
+        without a key, so its length always matches page_count // 2.
+        """
+        return final_pdf_path + ".keys"
+
+    def append_pdf(self, data_list: list[ExtractedData], page_callback=None) -> int:
+        """Add records that are not yet in the existing output; returns how many were added.
+
+        Only the new records are rendered, and the output is extended with an
+        incremental save, so the cost does not depend on the size of the file.
+        Falls back to generate_pdf when there is no output yet.
+        """
+        file_base_name = self.output_name
+        final_pdf_path = os.path.join(self.output_dir, f"fmtd_{file_base_name}")
+        if not os.path.exists(final_pdf_path):
+            self.generate_pdf(data_list, page_callback)
+            return len(data_list)
+
+        with fitz.open(final_pdf_path) as output:
+            record_count = output.page_count // 2
+        index_path = self.record_index_path(final_pdf_path)
+        index_keys = None
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as index_file:
+                index_keys = [line.rstrip("\n") for line in index_file]
+        if index_keys is None or len(index_keys) != record_count:
+            # Outputs made before the index existed, or an earlier append that saved
+            # the PDF but not the index: read the records back from the pages
+            if index_keys is not None:
+                logging.warning("Record index of %s lists %d record(s) but the output has %d, rebuilding it",
+                                final_pdf_path, len(index_keys), record_count)
+            self.rebuild_record_index(final_pdf_path)
+            with open(index_path, encoding="utf-8") as index_file:
+                index_keys = [line.rstrip("\n") for line in index_file]
+        existing_keys = set(index_keys)
+        existing_keys.discard("")
+
+        new_records = []
+        for data in data_list:
+            if not data.record_key:
+                # Nothing to identify the record by, so it cannot be deduplicated
+                logging.warning("Appending record with no name or address to %s without dedupe", final_pdf_path)
+                new_records.append(data)
+            elif data.record_key not in existing_keys:
+                existing_keys.add(data.record_key)
+                new_records.append(data)
+        if not new_records:
+            return 0
+
+        existing_pdf_path = os.path.join(current_dir, "docs", 'Page 2 REVISED NEW.pdf')  # Existing PDF for alternate pages
+        generated_pdfs = []
+        output = fitz.open(final_pdf_path)
+        template = fitz.open(existing_pdf_path)
+        try:
+            # Record index of the first appended page; the output has two pages per record
+            first_index = output.page_count // 2
+            for index, data in enumerate(new_records):
+                generated_pdf_path = os.path.join(self.output_dir, f"pg_append_{index + 1}_{file_base_name}")
+                generated_pdfs.append(generated_pdf_path)
+                self.create_pdf_page(generated_pdf_path, data)
+                if page_callback:
+                    page_callback(first_index + index, generated_pdf_path)
+
+                # Same alternating layout as generate_pdf
+                with fitz.open(generated_pdf_path) as page_doc:
+                    output.insert_pdf(page_doc)
+                output.insert_pdf(template)
+
+            if output.can_save_incrementally():
+                output.save(final_pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+            else:
+                # Damaged/repaired files cannot be extended in place; rewrite them once
+                temp_path = final_pdf_path + ".tmp"
+                output.save(temp_path, garbage=1)
+                output.close()
+                os.replace(temp_path, final_pdf_path)
+        finally:
+            if not output.is_closed:
+                output.close()
+            template.close()
+            self.delete_generated_pdfs(generated_pdfs)
+
+        with open(index_path, "a", encoding="utf-8") as index_file:
+            index_file.writelines(data.record_key + "\n" for data in new_records)
+        logging.info("Appended %d new record(s) to %s", len(new_records), final_pdf_path)
+        return len(new_records)
+
+    def rebuild_record_index(self, final_pdf_path: str) -> int:
+        """Write the record index of an existing output from the text of its generated pages."""
+        fields = {
+            self.RECIPIENT_BASELINE: "recipient_name",
+            self.STREET_BASELINE: "street_address",
+            self.CITY_ZIP_BASELINE: "city_and_zip",
+            self.FULL_ADDRESS_BASELINE: "full_address",
+        }
+        keys = []
+        with fitz.open(final_pdf_path) as output:
+            # Generated pages alternate with the template page, starting with the first
+            for page in output.pages(0, None, 2):
+                values = dict.fromkeys(fields.values(), "")
+                for block in page.get_text("dict")["blocks"]:
+                    for line in block.get("lines", []):
+                        baseline = line["spans"][0]["origin"][1]
+                        for field_baseline, name in fields.items():
+                            if abs(baseline - field_baseline) < 1:
+                                values[name] = "".join(span["text"] for span in line["spans"]).strip()
+                city_and_state, _, zip_code = values["city_and_zip"].rpartition(" ")
+                if not re.fullmatch(r"\d{5}", zip_code):
+                    city_and_state, zip_code = values["city_and_zip"], ""
+                record = ExtractedData(full_address=values["full_address"],
+                                       recipient_name=values["recipient_name"],
+                                       street_address=values["street_address"],
+                                       city_and_state=city_and_state, zip_code=zip_code,
+                                       estimated_value=0, value_range_low=0, value_range_high=0)
+                keys.append(record.record_key)
+        with open(self.record_index_path(final_pdf_path), "w", encoding="utf-8") as index_file:
+            index_file.writelines(key + "\n" for key in keys)
+        logging.info("Rebuilt record index for %s from %d page(s)", final_pdf_path, len(keys))
+        return len(keys)
 
     def create_pdf_page(self, pdf_path, data: ExtractedData):
         c = canvas.Canvas(pdf_path, pagesize=letter)
@@ -1,13 +1,18 @@
 import os
+import queue
 import logging
 import threading
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from typing import List
+import fitz  # PyMuPDF
 import tkinter as tk
-from tkinter import filedialog, ttk
+from tkinter import filedialog, messagebox, ttk
 from data_extractor import PDFExtractor
 from document_generator_updated import DocumentGenerator
 from data_extractor import ExtractedData
+from avm_analytics import drop_flagged_records
+from preflight import run_preflight
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -23,14 +28,16 @@ class BatchProcessor:
         logging.info("BatchProcessor initialized with max_workers=%d", max_workers)
         
     def process_files(self, input_files: List[str], output_dir: str, 
-                     progress_callback=None):
+                     progress_callback=None, append: bool = False, page_callback=None,
+                     drop_flagged: bool = False):
         logging.info("Starting to process %d files", len(input_files))
         with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             futures = []
             for input_file in input_files:
                 logging.info("Submitting file for processing: %s", input_file)
                 future = executor.submit(self._process_single_file,
-                                      input_file, output_dir)
+                                      input_file, output_dir, append, page_callback,
+                                      drop_flagged)
                 futures.append(future)
                 
             for i, future in enumerate(futures):
@@ -43,25 +50,107 @@ class BatchProcessor:
                     logging.error("Error processing %s: %s", input_files[i], str(e))
                     print(f"Error processing {input_files[i]}: {str(e)}")
                     
-    def _process_single_file(self, input_file: str, output_dir: str):
+    def _process_single_file(self, input_file: str, output_dir: str, append: bool = False,
+                             page_callback=None, drop_flagged: bool = False):
         try:
             logging.info("Processing single file: %s", input_file)
             extractor = PDFExtractor(input_file)
             extracted_data_list = extractor.extract_data()            
+            if drop_flagged:
+                extracted_data_list = drop_flagged_records(extracted_data_list)
             generator = DocumentGenerator(output_dir, input_file)
-            generator.generate_pdf(extracted_data_list)
+            file_page_callback = ((lambda index, path: page_callback(input_file, index, path))
+                                  if page_callback else None)
+            if append:
+                added = generator.append_pdf(extracted_data_list, page_callback=file_page_callback)
+                logging.info("Appended %d new record(s) for file %s", added, input_file)
+            else:
+                generator.generate_pdf(extracted_data_list, page_callback=file_page_callback)
             logging.info("Generated output for file %s: ", input_file)
                 
         except Exception as e:
             logging.error("Failed to process %s: %s", input_file, str(e))
             raise Exception(f"Failed to process {input_file}: {str(e)}")
 
+class ThumbnailCache:
+    """Thread-safe LRU of rasterized thumbnails, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def put(self, key, data: bytes):
+        with self._lock:
+            if key in self._items:
+                self.current_bytes -= len(self._items.pop(key))
+            self._items[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+
+class ThumbnailRenderer:
+    """Rasterizes PDF pages on a background thread so neither Tk nor the workers wait on it."""
+
+    def __init__(self, cache: ThumbnailCache, on_ready, zoom: float = 0.3):
+        self.cache = cache
+        self.on_ready = on_ready
+        self.zoom = zoom
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, key, pdf_bytes: bytes = None, pdf_path: str = None, page_number: int = 0):
+        """Queue a page for rendering from in-memory PDF bytes or from a file on disk."""
+        self._jobs.put((key, pdf_bytes, pdf_path, page_number))
+
+    def _run(self):
+        while True:
+            key, pdf_bytes, pdf_path, page_number = self._jobs.get()
+            if self.cache.get(key) is not None:
+                self.on_ready(key)
+                continue
+            try:
+                doc = fitz.open(stream=pdf_bytes, filetype="pdf") if pdf_bytes else fitz.open(pdf_path)
+                with doc:
+                    if page_number >= doc.page_count:
+                        # Output not merged/appended yet; the caller retries later
+                        continue
+                    pixmap = doc[page_number].get_pixmap(matrix=fitz.Matrix(self.zoom, self.zoom), alpha=False)
+                    self.cache.put(key, pixmap.tobytes("ppm"))
+                self.on_ready(key)
+            except Exception as e:
+                logging.warning("Could not render preview for %s: %s", key, str(e))
+
+
 class Application(tk.Tk):
+    # Number of leading pages of each output that get a preview thumbnail
+    PREVIEW_PAGES = 5
+    # Milliseconds between checks for an output that does not have a page yet
+    PREVIEW_RETRY_MS = 1000
+    # Checks before giving up on a thumbnail, e.g. when its output failed
+    PREVIEW_RETRIES = 30
+
     def __init__(self):
         super().__init__()
         
         self.title("PDF Processor v2.0 - Document Generator")
-        self.geometry("600x700")  # Increased height from 500 to 700
+        self.geometry("900x700")  # Widened from 600 to 900 for the preview pane beside the controls
         self.resizable(True, True)
         
         # Configure the main window
@@ -80,6 +169,18 @@ class Application(tk.Tk):
         # Initialize variables
         self.selected_files = []
         self.output_directory = ""
+        self.append_mode = tk.BooleanVar(value=False)
+        self.drop_flagged = tk.BooleanVar(value=False)
+        self.preview_keys = []  # (run, input_file, record index) in the order pages were produced
+        self.preview_run = 0  # Tells this run's thumbnails apart from a previous run's
+        self.preview_counts = {}  # Pages previewed so far per input file
+        self.preview_position = 0
+        self.preview_output_mtimes = {}  # Output mtimes when the run started, None if absent
+        self.preview_retry_id = None  # Pending retry_preview, at most one at a time
+        self.preview_image = None  # Keep a reference so Tk does not drop the image
+        self.thumbnail_cache = ThumbnailCache()
+        self.thumbnail_renderer = ThumbnailRenderer(
+            self.thumbnail_cache, lambda key: self.after(0, self.on_thumbnail_ready, key))
         
         logging.info("Application initialized")
         self.setup_ui()
@@ -90,8 +191,12 @@ class Application(tk.Tk):
         main_frame = ttk.Frame(self, padding="30")
         main_frame.pack(fill=tk.BOTH, expand=True)
         
+        # Controls on the left, preview on the right so the window keeps its height
+        controls_frame = ttk.Frame(main_frame)
+        controls_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
         # Title section
-        title_frame = ttk.Frame(main_frame)
+        title_frame = ttk.Frame(controls_frame)
         title_frame.pack(fill=tk.X, pady=(0, 30))
         
         title_label = ttk.Label(title_frame, text="PDF Document Processor", style='Title.TLabel')
@@ -103,7 +208,7 @@ class Application(tk.Tk):
         subtitle_label.pack(pady=(5, 0))
         
         # Input files section
-        input_frame = ttk.LabelFrame(main_frame, text="Input Files", padding="15")
+        input_frame = ttk.LabelFrame(controls_frame, text="Input Files", padding="15")
         input_frame.pack(fill=tk.X, pady=(0, 20))
         
         # File selection area
@@ -140,7 +245,7 @@ class Application(tk.Tk):
         self.files_listbox.config(yscrollcommand=files_scrollbar.set)
         
         # Output directory section
-        output_frame = ttk.LabelFrame(main_frame, text="Output Directory", padding="15")
+        output_frame = ttk.LabelFrame(controls_frame, text="Output Directory", padding="15")
         output_frame.pack(fill=tk.X, pady=(0, 20))
         
         output_selection_frame = ttk.Frame(output_frame)
@@ -157,8 +262,18 @@ class Application(tk.Tk):
                                          style='Status.TLabel')
         self.output_path_label.pack(side=tk.LEFT, padx=(15, 0))
         
+        self.append_check = ttk.Checkbutton(output_frame,
+                                          text="Append new records to existing outputs",
+                                          variable=self.append_mode)
+        self.append_check.pack(anchor=tk.W, pady=(10, 0))
+        
+        self.drop_flagged_check = ttk.Checkbutton(output_frame,
+                                                text="Skip records with missing or invalid values",
+                                                variable=self.drop_flagged)
+        self.drop_flagged_check.pack(anchor=tk.W, pady=(5, 0))
+        
         # Process section
-        process_frame = ttk.Frame(main_frame)
+        process_frame = ttk.Frame(controls_frame)
         process_frame.pack(fill=tk.X, pady=(0, 20))
         
         self.process_btn = ttk.Button(process_frame, 
@@ -169,7 +284,7 @@ class Application(tk.Tk):
         self.process_btn.pack()
         
         # Progress section
-        progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="15")
+        progress_frame = ttk.LabelFrame(controls_frame, text="Progress", padding="15")
         progress_frame.pack(fill=tk.X, pady=(0, 20))
         
         self.progress = ttk.Progressbar(progress_frame, length=400, mode='determinate')
@@ -178,6 +293,29 @@ class Application(tk.Tk):
         self.status_label = ttk.Label(progress_frame, text="Ready to process files", style='Status.TLabel')
         self.status_label.pack()
         
+        # Preview section
+        preview_frame = ttk.LabelFrame(main_frame, text="Preview", padding="15")
+        preview_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=(20, 0))
+        
+        self.preview_label = ttk.Label(preview_frame, text="Pages appear here as they are generated",
+                                     style='Status.TLabel', anchor=tk.CENTER, wraplength=200)
+        self.preview_label.pack(fill=tk.BOTH, expand=True)
+        
+        self.preview_caption = ttk.Label(preview_frame, text="", style='Status.TLabel',
+                                       anchor=tk.CENTER, wraplength=200)
+        self.preview_caption.pack(fill=tk.X, pady=(10, 0))
+        
+        preview_nav_frame = ttk.Frame(preview_frame)
+        preview_nav_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        self.preview_prev_btn = ttk.Button(preview_nav_frame, text="◀ Previous",
+                                         command=lambda: self.show_preview(self.preview_position - 1))
+        self.preview_prev_btn.pack(side=tk.LEFT)
+        
+        self.preview_next_btn = ttk.Button(preview_nav_frame, text="Next ▶",
+                                         command=lambda: self.show_preview(self.preview_position + 1))
+        self.preview_next_btn.pack(side=tk.RIGHT)
+        
     
     def select_files(self):
         files = filedialog.askopenfilenames(
@@ -237,8 +375,20 @@ class Application(tk.Tk):
             self.status_label.config(text="Please select files and output directory first")
             return
         
-        # Reset progress
+        # Reset progress and preview
         self.progress['value'] = 0
+        self.preview_run += 1
+        self.preview_keys = []
+        self.preview_counts = {}
+        self.preview_position = 0
+        self.preview_output_dir = self.output_directory
+        self.cancel_preview_retry()
+        # Outputs from an earlier run must not be used to re-render this run's pages
+        self.preview_output_mtimes = {input_file: self.output_mtime(input_file)
+                                      for input_file in self.selected_files}
+        self.thumbnail_cache.clear()
+        self.preview_label.config(image="", text="Pages appear here as they are generated")
+        self.preview_caption.config(text="")
         self.status_label.config(text="Starting processing...")
         self.process_btn.config(state='disabled')
         
@@ -249,13 +399,45 @@ class Application(tk.Tk):
         thread.start()
     
     def process_files_thread(self):
-        """Process files in a separate thread"""
+        """Check the inputs, then process files in a separate thread"""
+        try:
+            self.after(0, lambda: self.status_label.config(text="Running pre-flight checks..."))
+            report = run_preflight(self.selected_files)
+        except Exception as e:
+            logging.error("Pre-flight check failed: %s", str(e))
+            report = None
+        
+        if report and report.refused:
+            self.after(0, lambda: messagebox.showerror("Pre-flight check failed", report.summary()))
+            self.after(0, lambda: self.status_label.config(text="❌ Input files do not match the expected layout"))
+            self.after(0, lambda: self.process_btn.config(state='normal'))
+            return
+        if report and report.warnings:
+            self.after(0, self.confirm_preflight_warnings, report)
+            return
+        self.render_files_thread()
+    
+    def confirm_preflight_warnings(self, report):
+        """Ask on the main loop whether to render despite pre-flight warnings"""
+        if messagebox.askyesno("Pre-flight warnings", report.summary() + "\n\nProcess the files anyway?"):
+            thread = threading.Thread(target=self.render_files_thread)
+            thread.daemon = True
+            thread.start()
+        else:
+            self.status_label.config(text="Processing cancelled after pre-flight check")
+            self.process_btn.config(state='normal')
+    
+    def render_files_thread(self):
+        """Extract and render the selected files"""
         processor = BatchProcessor()
         try:
             processor.process_files(
                 self.selected_files,
                 self.output_directory,
-                self.update_progress
+                self.update_progress,
+                append=self.append_mode.get(),
+                page_callback=self.queue_preview_page,
+                drop_flagged=self.drop_flagged.get()
             )
             self.after(0, lambda: self.status_label.config(text="✅ Processing completed successfully!"))
             self.after(0, lambda: self.process_btn.config(state='normal'))
@@ -271,6 +453,90 @@ class Application(tk.Tk):
         self.after(0, lambda: self.progress.config(value=value))
         self.after(0, lambda: self.status_label.config(text=f"Processing... {value:.1f}% complete"))
         logging.info("Progress updated to %.2f%%", value)
+    
+    def queue_preview_page(self, input_file, index, page_pdf_path):
+        """Called from worker threads for every generated page; hands the first few to the renderer"""
+        try:
+            # Each input file is handled by a single worker thread, so its count is not shared
+            count = self.preview_counts.get(input_file, 0)
+            if count >= self.PREVIEW_PAGES:
+                return
+            self.preview_counts[input_file] = count + 1
+            # Read the single-page PDF now, it is deleted once the output has been merged
+            with open(page_pdf_path, "rb") as page_file:
+                pdf_bytes = page_file.read()
+            self.thumbnail_renderer.submit((self.preview_run, input_file, index), pdf_bytes=pdf_bytes)
+        except Exception as e:
+            # Runs inside generate_pdf/append_pdf; a preview problem must not fail the render
+            logging.warning("Could not queue preview for %s page %d: %s", input_file, index, str(e))
+    
+    def on_thumbnail_ready(self, key):
+        """Runs on the Tk main loop once a thumbnail is in the cache"""
+        if key[0] != self.preview_run:
+            return  # Left over from a previous run
+        if key not in self.preview_keys:
+            self.preview_keys.append(key)
+            self.preview_keys.sort(key=lambda k: (self.selected_files.index(k[1])
+                                                  if k[1] in self.selected_files else 0, k[2]))
+            if len(self.preview_keys) > 1 and self.preview_keys.index(key) <= self.preview_position:
+                # Keep the page the operator is looking at in place
+                self.preview_position += 1
+        if len(self.preview_keys) == 1 or key == self.preview_keys[self.preview_position]:
+            self.show_preview(self.preview_position)
+        else:
+            self.update_preview_caption()
+    
+    def show_preview(self, position, tries=0):
+        if not self.preview_keys:
+            return
+        self.cancel_preview_retry()
+        self.preview_position = max(0, min(position, len(self.preview_keys) - 1))
+        key = self.preview_keys[self.preview_position]
+        data = self.thumbnail_cache.get(key)
+        if data is None:
+            # Evicted from the cache: re-render it from the output, which may not be
+            # merged yet, so check again until the thumbnail is back
+            _, input_file, index = key
+            mtime = self.output_mtime(input_file)
+            if mtime is not None and mtime != self.preview_output_mtimes.get(input_file):
+                self.thumbnail_renderer.submit(key, pdf_path=self.output_path(input_file), page_number=index * 2)
+            if tries < self.PREVIEW_RETRIES:
+                self.preview_retry_id = self.after(self.PREVIEW_RETRY_MS, self.retry_preview, key, tries + 1)
+                self.preview_label.config(image="", text="Rendering preview...")
+            else:
+                self.preview_label.config(image="", text="Preview not available")
+        else:
+            self.preview_image = tk.PhotoImage(data=data, format="ppm")
+            self.preview_label.config(image=self.preview_image, text="")
+        self.update_preview_caption()
+    
+    def output_path(self, input_file):
+        return os.path.join(self.preview_output_dir, f"fmtd_{os.path.basename(input_file)}")
+    
+    def output_mtime(self, input_file):
+        """Modification time of the output for input_file, or None if there is none yet"""
+        try:
+            return os.stat(self.output_path(input_file)).st_mtime_ns
+        except OSError:
+            return None
+    
+    def retry_preview(self, key, tries):
+        """Re-request an evicted thumbnail while the operator is still looking at it"""
+        self.preview_retry_id = None
+        if (self.preview_keys and key == self.preview_keys[self.preview_position]
+                and self.thumbnail_cache.get(key) is None):
+            self.show_preview(self.preview_position, tries)
+    
+    def cancel_preview_retry(self):
+        if self.preview_retry_id is not None:
+            self.after_cancel(self.preview_retry_id)
+            self.preview_retry_id = None
+    
+    def update_preview_caption(self):
+        _, input_file, index = self.preview_keys[self.preview_position]
+        self.preview_caption.config(
+            text=f"{os.path.basename(input_file)} - page {index * 2 + 1} "
+                 f"({self.preview_position + 1} of {len(self.preview_keys)})")
 
 if __name__ == "__main__":
     logging.info("Application started")
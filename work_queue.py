@@ -0,0 +1,357 @@
+import os
+import sys
+import glob
+import time
+import socket
+import shutil
+import sqlite3
+import logging
+import argparse
+import threading
+import multiprocessing
+from dataclasses import dataclass
+from typing import List, Optional
+from data_extractor import PDFExtractor
+from document_generator_updated import DocumentGenerator
+
+# Job states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT NOT NULL UNIQUE,
+    input_file TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    page_start INTEGER NOT NULL DEFAULT 0,
+    page_end INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS results (
+    job_key TEXT PRIMARY KEY,
+    output_path TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    completed REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    job_key: str
+    input_file: str
+    output_dir: str
+    page_start: int
+    page_end: Optional[int]
+    attempts: int
+
+    @property
+    def output_name(self) -> str:
+        """Base name for the generated file; page-range jobs get their own suffix."""
+        base_name = os.path.basename(self.input_file)
+        if self.page_start == 0 and self.page_end is None:
+            return base_name
+        stem, ext = os.path.splitext(base_name)
+        end = "end" if self.page_end is None else str(self.page_end)
+        return f"{stem}_p{self.page_start + 1}-{end}{ext}"
+
+
+class WorkQueue:
+    """Job queue stored in a single SQLite file on a shared volume.
+
+    Jobs are leased to one worker at a time. A worker keeps its lease alive
+    with heartbeat(); a lease that is not renewed expires and the job goes back
+    to any worker, up to max_attempts. Results are registered once per job key,
+    and only by the worker holding the lease, so a job is only recorded once.
+    Note that SQLite locking relies on the file system; on NFS make sure the
+    share supports POSIX locks (lockd) before pointing several hosts at it.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 300, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per call so the queue can be used from heartbeat threads
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return _Transaction(conn)
+
+    def enqueue(self, input_file: str, output_dir: str,
+                page_start: int = 0, page_end: Optional[int] = None) -> bool:
+        """Add a job; returns False if the same file/range/output is already queued."""
+        input_file = os.path.abspath(input_file)
+        output_dir = os.path.abspath(output_dir)
+        job_key = f"{input_file}|{page_start}|{'' if page_end is None else page_end}|{output_dir}"
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_key, input_file, output_dir, page_start, page_end, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_key, input_file, output_dir, page_start, page_end, time.time()))
+            added = cursor.rowcount == 1
+        if added:
+            logging.info("Enqueued %s (pages %s-%s)", input_file, page_start + 1,
+                         "end" if page_end is None else page_end)
+        return added
+
+    def enqueue_file(self, input_file: str, output_dir: str, pages_per_job: Optional[int] = None) -> int:
+        """Enqueue a whole file, or split it into page ranges of pages_per_job pages."""
+        if not pages_per_job:
+            return int(self.enqueue(input_file, output_dir))
+        import fitz  # PyMuPDF
+        with fitz.open(input_file) as doc:
+            page_count = doc.page_count
+        added = 0
+        for start in range(0, page_count, pages_per_job):
+            end = min(start + pages_per_job, page_count)
+            added += self.enqueue(input_file, output_dir, start, end)
+        return added
+
+    def lease(self, worker_id: str) -> Optional[Job]:
+        """Take the oldest pending (or expired) job, or None if there is nothing to do."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Expired leases that have used up their attempts are given up on
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = COALESCE(last_error, 'lease expired'), updated = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts))
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (PENDING, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE id = ?",
+                (LEASED, worker_id, now + self.lease_seconds, now, row["id"]))
+        return Job(id=row["id"], job_key=row["job_key"], input_file=row["input_file"],
+                   output_dir=row["output_dir"], page_start=row["page_start"],
+                   page_end=row["page_end"], attempts=row["attempts"] + 1)
+
+    def heartbeat(self, job: Job, worker_id: str) -> bool:
+        """Extend the lease; returns False if the job is no longer ours."""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND status = ? AND worker_id = ?",
+                (now + self.lease_seconds, now, job.id, LEASED, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, job: Job, worker_id: str, output_path: str, publish=None) -> bool:
+        """Register the job's result if worker_id still holds the lease.
+
+        publish (e.g. moving the staged output into place) runs while the
+        database write lock is held, after the lease check, so only the worker
+        whose result is registered ever writes the output. Returns False, and
+        does not call publish, if the lease was lost or the result already exists.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, lease_expires = NULL, last_error = NULL, updated = ? "
+                "WHERE id = ? AND status = ? AND worker_id = ?",
+                (DONE, now, job.id, LEASED, worker_id))
+            if cursor.rowcount != 1:
+                return False
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO results (job_key, output_path, worker_id, completed) VALUES (?, ?, ?, ?)",
+                (job.job_key, output_path, worker_id, now))
+            if cursor.rowcount != 1:
+                return False
+            if publish:
+                # An exception here rolls back the registration
+                publish()
+        return True
+
+    def fail(self, job: Job, worker_id: str, error: str):
+        """Release a failed job for retry, or mark it failed after max_attempts."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "lease_expires = NULL, last_error = ?, updated = ? "
+                "WHERE id = ? AND status = ? AND worker_id = ?",
+                (self.max_attempts, FAILED, PENDING, error, now, job.id, LEASED, worker_id))
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def jobs(self) -> List[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+
+    def results(self) -> List[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM results ORDER BY completed").fetchall()
+
+
+class _Transaction:
+    """Context manager that commits (or rolls back) and always closes the connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.close()
+        return False
+
+
+class QueueWorker:
+    """Pulls jobs from a WorkQueue and runs them through PDFExtractor/DocumentGenerator."""
+
+    def __init__(self, queue: WorkQueue, worker_id: str = None, poll_interval: float = 2.0):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        logging.info("QueueWorker %s started on %s", self.worker_id, queue.db_path)
+
+    def run(self, idle_timeout: Optional[float] = None) -> int:
+        """Process jobs until the queue stays empty for idle_timeout seconds (forever if None)."""
+        processed = 0
+        idle_since = time.time()
+        while True:
+            job = self.queue.lease(self.worker_id)
+            if job is None:
+                if idle_timeout is not None and time.time() - idle_since >= idle_timeout:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            self.run_job(job)
+            processed += 1
+            idle_since = time.time()
+        logging.info("QueueWorker %s finished after %d job(s)", self.worker_id, processed)
+        return processed
+
+    def run_job(self, job: Job):
+        stop = threading.Event()
+        lease_lost = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(job, stop, lease_lost), daemon=True)
+        heartbeat.start()
+        # Render into a private staging directory; the finished file is only moved
+        # into place by complete(), so a crashed worker or one that lost its lease
+        # never touches the output.
+        staging_root = os.path.join(job.output_dir, ".staging")
+        staging_dir = os.path.join(staging_root, f"{self.worker_id}-{job.id}")
+        try:
+            # Leftovers of earlier attempts at this job by workers that crashed or were killed
+            for stale_dir in glob.glob(os.path.join(glob.escape(staging_root), f"*-{job.id}")):
+                shutil.rmtree(stale_dir, ignore_errors=True)
+            os.makedirs(staging_dir, exist_ok=True)
+            staged_path = self._process_job(job, staging_dir)
+            output_path = os.path.join(job.output_dir, os.path.basename(staged_path))
+            if lease_lost.is_set():
+                logging.warning("Discarding job %d, its lease was taken over", job.id)
+            elif self.queue.complete(job, self.worker_id, output_path,
+                                     publish=lambda: self._publish(staged_path, output_path)):
+                logging.info("Completed job %d: %s", job.id, output_path)
+            else:
+                logging.warning("Discarding job %d, lost its lease or already registered", job.id)
+        except Exception as e:
+            logging.error("Job %d failed on attempt %d: %s", job.id, job.attempts, str(e))
+            self.queue.fail(job, self.worker_id, str(e))
+        finally:
+            stop.set()
+            heartbeat.join()
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            try:
+                os.rmdir(staging_root)
+            except OSError:
+                pass  # Other workers are still staging jobs here
+
+    def _heartbeat_loop(self, job: Job, stop: threading.Event, lease_lost: threading.Event):
+        while not stop.wait(self.queue.lease_seconds / 3):
+            if not self.queue.heartbeat(job, self.worker_id):
+                logging.warning("Lost lease on job %d", job.id)
+                lease_lost.set()
+                return
+
+    def _process_job(self, job: Job, staging_dir: str) -> str:
+        extractor = PDFExtractor(job.input_file)
+        extracted_data_list = extractor.extract_data(job.page_start, job.page_end)
+        generator = DocumentGenerator(staging_dir, job.input_file, output_name=job.output_name)
+        return generator.generate_pdf(extracted_data_list)
+
+    @staticmethod
+    def _publish(staged_path: str, output_path: str):
+        os.replace(DocumentGenerator.record_index_path(staged_path),
+                   DocumentGenerator.record_index_path(output_path))
+        os.replace(staged_path, output_path)
+
+
+def _run_worker(db_path: str, lease_seconds: float, max_attempts: int, idle_timeout: Optional[float]):
+    queue = WorkQueue(db_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    return QueueWorker(queue).run(idle_timeout=idle_timeout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared work queue for PDF batch processing")
+    parser.add_argument("db", help="Path to the queue database (on the shared volume)")
+    parser.add_argument("--lease-seconds", type=float, default=300)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Add input PDFs to the queue")
+    enqueue.add_argument("output_dir")
+    enqueue.add_argument("input_files", nargs="+")
+    enqueue.add_argument("--pages-per-job", type=int, default=None,
+                         help="Split each file into jobs of this many pages")
+
+    worker = commands.add_parser("worker", help="Process jobs from the queue")
+    worker.add_argument("--processes", type=int, default=1, help="Worker processes to start on this host")
+    worker.add_argument("--idle-timeout", type=float, default=None,
+                        help="Exit after the queue has been empty this many seconds")
+
+    commands.add_parser("status", help="Show job counts")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    queue = WorkQueue(args.db, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+
+    if args.command == "enqueue":
+        os.makedirs(args.output_dir, exist_ok=True)
+        added = sum(queue.enqueue_file(f, args.output_dir, args.pages_per_job) for f in args.input_files)
+        print(f"Enqueued {added} job(s)")
+    elif args.command == "worker":
+        started = time.time()
+        if args.processes <= 1:
+            processed = QueueWorker(queue).run(idle_timeout=args.idle_timeout)
+        else:
+            with multiprocessing.Pool(args.processes) as pool:
+                processed = sum(pool.starmap(_run_worker, [
+                    (args.db, args.lease_seconds, args.max_attempts, args.idle_timeout)
+                ] * args.processes))
+        print(f"Processed {processed} job(s) in {time.time() - started:.1f}s")
+    print(queue.stats())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())